@@ -1,14 +1,37 @@
 #!/usr/bin/env python3
 
 import os
+import queue
 import sys
+import shutil
+import subprocess
+import threading
 import jwt
+import orjson
 import requests
-import git
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import List, Dict, Optional
 import json
-from datetime import datetime
+from datetime import datetime, timezone
+
+# (connect, read) timeout in seconds for API calls
+API_TIMEOUT = (3, 30)
+
+# Upper bound in seconds for a single git clone or fetch
+CLONE_TIMEOUT = 600
+
+# Network settings for every git invocation; stalled transfers below 1KB/s for 20s are aborted
+GIT_NETWORK_CONFIG = [
+    '-c', 'protocol.version=2',
+    '-c', 'http.lowSpeedLimit=1000',
+    '-c', 'http.lowSpeedTime=20',
+]
+
+# Upper bound on threads writing and running generated files for a task
+FILE_CREATION_WORKERS = min(8, (os.cpu_count() or 1) * 2)
 
 class TaskAgent:
     def __init__(self):
@@ -16,7 +39,16 @@ class TaskAgent:
         self.api_base_url = os.getenv('API_BASE_URL', 'http://host.docker.internal:5000')
         self.workspace_dir = Path(os.getenv('WORKSPACE_DIR', '/workspace'))
         self.container_id = os.getenv('CONTAINER_ID')
+        self.clone_concurrency = max(1, int(os.getenv('CLONE_CONCURRENCY', '4')))
+        self.clone_depth = max(0, int(os.getenv('CLONE_DEPTH', '1')))
+        self.script_timeout = int(os.getenv('SCRIPT_TIMEOUT', '300'))
+        self.force_fresh_clone = os.getenv('FORCE_FRESH_CLONE', '').lower() in ('1', 'true', 'yes')
         self.project_id = None
+        self._print_lock = threading.Lock()
+        self._bootstrap: Optional[Dict] = None
+        self._task_items: Dict[str, List[Dict]] = {}
+        self._status_queue: List[Dict] = []
+        self._created_dirs: set = set()
         
         if not self.jwt_token:
             raise ValueError("JWT_TOKEN environment variable is required")
@@ -33,34 +65,81 @@ class TaskAgent:
         except Exception as e:
             raise ValueError(f"Invalid JWT token: {e}")
         
+        # Reuse pooled keep-alive connections for every API call; the token is fixed for the container's lifetime
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Authorization': f'Bearer {self.jwt_token}',
+            'Content-Type': 'application/json'
+        })
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=32,
+            max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        
+        # Full URLs for the endpoints hit repeatedly during a run
+        self._base = self.api_base_url.rstrip('/')
+        self._bootstrap_url = f"{self._base}/api/agent/bootstrap"
+        self._batch_status_url = f"{self._base}/api/agent/tasks/batch-status"
+        self._container_url = f"{self._base}/api/containers/{self.container_id}"
+        
+        # Status updates are sent by a background worker so the main flow never waits on them
+        self._update_queue: queue.Queue = queue.Queue()
+        self._update_worker = threading.Thread(target=self._update_worker_loop, daemon=True)
+        self._update_worker.start()
+        
         print(f"Agent initialized for project: {self.project_id}")
         print(f"Container ID: {self.container_id}")
         print(f"Workspace directory: {self.workspace_dir}")
         print(f"API base URL: {self.api_base_url}")
 
-    def make_api_request(self, endpoint: str, method: str = 'GET', data: Optional[Dict] = None) -> Optional[Dict]:
-        """Make authenticated API request"""
-        headers = {
-            'Authorization': f'Bearer {self.jwt_token}',
-            'Content-Type': 'application/json'
-        }
-        
-        url = f"{self.api_base_url}{endpoint}"
-        
+    def log(self, message: str = ""):
+        """Print a message without interleaving output from worker threads"""
+        with self._print_lock:
+            print(message)
+
+    def _request(self, url: str, method: str = 'GET', data: Optional[Dict] = None) -> Optional[Dict]:
+        """Make authenticated API request to a full URL"""
         try:
             if method == 'GET':
-                response = requests.get(url, headers=headers)
-            elif method == 'PATCH':
-                response = requests.patch(url, headers=headers, json=data)
+                response = self.session.get(url, timeout=API_TIMEOUT)
             else:
-                response = requests.request(method, url, headers=headers, json=data)
+                # Content-Type is already set on the session
+                body = orjson.dumps(data) if data is not None else None
+                response = self.session.request(method, url, data=body, timeout=API_TIMEOUT)
             
             response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
-            print(f"API request failed: {e}")
+            return orjson.loads(response.content)
+        except (requests.RequestException, orjson.JSONDecodeError) as e:
+            self.log(f"API request failed: {e}")
             return None
     
+    def _update_worker_loop(self):
+        """Send queued updates until the None sentinel arrives; failures are logged, never raised"""
+        while True:
+            update = self._update_queue.get()
+            if update is None:
+                return
+            url, method, data, success_message, failure_message = update
+            try:
+                result = self._request(url, method=method, data=data)
+            except Exception as e:
+                self.log(f"{failure_message}: {e}")
+                continue
+            self.log(success_message if result is not None else failure_message)
+    
+    def send_in_background(self, url: str, method: str, data: Dict, success_message: str, failure_message: str):
+        """Queue an API update for the background worker"""
+        self._update_queue.put((url, method, data, success_message, failure_message))
+    
+    def wait_for_updates(self):
+        """Stop the background worker once every queued update has been sent"""
+        if self._update_worker.is_alive():
+            self._update_queue.put(None)
+            self._update_worker.join()
+    
     def update_container_status(self, status: str, exit_code: Optional[int] = None):
         """Update the container status"""
         update_data = {
@@ -68,25 +147,40 @@ class TaskAgent:
         }
         
         if status == 'completed' or status == 'failed':
-            update_data['completedAt'] = datetime.now().isoformat()
+            # orjson serializes aware datetimes to ISO 8601 directly
+            update_data['completedAt'] = datetime.now(timezone.utc)
             
         if exit_code is not None:
             update_data['exitCode'] = exit_code
             
-        endpoint = f"/api/containers/{self.container_id}"
-        result = self.make_api_request(endpoint, method='PATCH', data=update_data)
+        self.send_in_background(
+            self._container_url, 'PATCH', update_data,
+            f"Container status updated to: {status}",
+            f"Failed to update container status to: {status}"
+        )
+
+    def load_bootstrap(self) -> Dict:
+        """Fetch repositories and pending tasks with their items in a single request"""
+        if self._bootstrap is None:
+            print(f"Fetching bootstrap data for project {self.project_id}...")
+            
+            # Agent-specific endpoint; repository tokens come back decrypted
+            bootstrap = self._request(self._bootstrap_url)
+            if bootstrap is None:
+                print("Failed to fetch bootstrap data")
+                return {}
+            
+            self._bootstrap = bootstrap
+            self._task_items = {
+                task['id']: task.get('taskItems') or []
+                for task in bootstrap.get('tasks') or []
+            }
         
-        if result:
-            print(f"Container status updated to: {status}")
-        else:
-            print(f"Failed to update container status to: {status}")
+        return self._bootstrap
 
     def get_project_repositories(self) -> List[Dict]:
-        """Fetch repositories for the current project"""
-        print(f"Fetching repositories for project {self.project_id}...")
-        
-        # Use the agent-specific endpoint that provides decrypted tokens
-        repos = self.make_api_request('/api/agent/repositories')
+        """Get repositories for the current project"""
+        repos = self.load_bootstrap().get('repositories')
         if repos is None:
             print("Failed to fetch repositories")
             return []
@@ -102,18 +196,14 @@ class TaskAgent:
         github_token = repo.get('githubToken')
         is_private = repo.get('isPrivate', False)
         
-        print(f"Cloning repository: {repo_name}")
-        print(f"URL: {repo_url}")
-        print(f"Target path: {clone_path}")
-        print(f"Private repo: {is_private}")
+        self.log(
+            f"Cloning repository: {repo_name}\n"
+            f"URL: {repo_url}\n"
+            f"Target path: {clone_path}\n"
+            f"Private repo: {is_private}"
+        )
         
         try:
-            # Remove existing directory if it exists
-            if clone_path.exists():
-                print(f"Directory {clone_path} already exists, removing...")
-                import shutil
-                shutil.rmtree(clone_path)
-            
             # Prepare clone URL with authentication if available
             clone_url = repo_url
             if github_token and is_private:
@@ -121,35 +211,93 @@ class TaskAgent:
                 # Format: https://token@github.com/owner/repo.git
                 if repo_url.startswith('https://github.com/'):
                     clone_url = repo_url.replace('https://github.com/', f'https://{github_token}@github.com/')
-                    print(f"Using authenticated clone URL")
+                    self.log(f"Using authenticated clone URL")
             elif is_private:
-                print("Warning: No GitHub token available for private repository")
+                self.log("Warning: No GitHub token available for private repository")
+            
+            # Reuse an existing clone so only new objects are fetched
+            if (clone_path / '.git').exists() and not self.force_fresh_clone:
+                if self._update_existing_clone(repo, clone_path, clone_url):
+                    self.log(f"✅ Updated existing clone of {repo_name}")
+                    return True
+            
+            # Remove existing directory if it exists
+            if clone_path.exists():
+                self.log(f"Directory {clone_path} already exists, removing...")
+                shutil.rmtree(clone_path)
             
-            # Clone the repository
-            git.Repo.clone_from(clone_url, clone_path)
-            print(f"✅ Successfully cloned {repo_name}")
+            # Clone the repository with the git CLI directly
+            self._run_git(*self._clone_options(repo), clone_url, str(clone_path))
+            self.log(f"✅ Successfully cloned {repo_name}")
             return True
             
-        except git.exc.GitCommandError as e:
-            # Handle specific Git errors
-            error_str = str(e)
+        except subprocess.CalledProcessError as e:
+            # Handle specific Git errors; stderr is used since the command line may contain the token
+            error_str = (e.stderr or '').strip()
             if "Authentication failed" in error_str or "Invalid username or token" in error_str:
-                print(f"❌ Authentication failed for {repo_name}")
+                self.log(f"❌ Authentication failed for {repo_name}")
                 if is_private:
-                    print(f"   The repository is private. Please ensure:")
-                    print(f"   1. A valid GitHub token is configured for this repository")
-                    print(f"   2. The token has 'repo' scope to access private repositories")
+                    self.log(f"   The repository is private. Please ensure:")
+                    self.log(f"   1. A valid GitHub token is configured for this repository")
+                    self.log(f"   2. The token has 'repo' scope to access private repositories")
             elif "Repository not found" in error_str or "repository not found" in error_str.lower():
-                print(f"❌ Repository not found: {repo_url}")
-                print(f"   Please check if the repository exists and is accessible")
+                self.log(f"❌ Repository not found: {repo_url}")
+                self.log(f"   Please check if the repository exists and is accessible")
             else:
-                print(f"❌ Git error cloning {repo_name}: {e}")
+                self.log(f"❌ Git error cloning {repo_name}: {error_str}")
+            return False
+            
+        except subprocess.TimeoutExpired:
+            self.log(f"❌ Timed out cloning {repo_name} after {CLONE_TIMEOUT}s")
             return False
             
         except Exception as e:
-            print(f"❌ Failed to clone {repo_name}: {e}")
+            self.log(f"❌ Failed to clone {repo_name}: {e}")
+            return False
+
+    def _run_git(self, *args: str, cwd: Optional[Path] = None) -> subprocess.CompletedProcess:
+        """Run a git command, raising CalledProcessError on failure"""
+        return subprocess.run(
+            ['git', *GIT_NETWORK_CONFIG, *args],
+            cwd=cwd,
+            check=True,
+            timeout=CLONE_TIMEOUT,
+            capture_output=True,
+            text=True,
+            env={**os.environ, 'GIT_TERMINAL_PROMPT': '0'}
+        )
+
+    def _update_existing_clone(self, repo: Dict, clone_path: Path, clone_url: str) -> bool:
+        """Fetch and hard-reset an existing clone; False means it must be recloned"""
+        try:
+            origin_url = self._run_git('remote', 'get-url', 'origin', cwd=clone_path).stdout.strip()
+            if origin_url != clone_url:
+                self.log(f"Remote URL changed for {repo['name']}, recloning...")
+                return False
+            
+            fetch_args = ['fetch', '--no-tags', '--prune']
+            if self.clone_depth:
+                fetch_args.append(f'--depth={self.clone_depth}')
+            self._run_git(*fetch_args, 'origin', repo.get('branch') or 'HEAD', cwd=clone_path)
+            self._run_git('reset', '--hard', 'FETCH_HEAD', cwd=clone_path)
+            self._run_git('clean', '-ffdx', cwd=clone_path)
+            return True
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+            self.log(f"Existing clone of {repo['name']} could not be updated, recloning...")
             return False
 
+    def _clone_options(self, repo: Dict) -> List[str]:
+        """Build git clone arguments; shallow single-branch unless CLONE_DEPTH=0"""
+        options = ['clone', '--no-tags']
+        if self.clone_depth:
+            options += [f'--depth={self.clone_depth}', '--single-branch']
+        else:
+            # Full history requested: skip historical blobs until they are needed
+            options.append('--filter=blob:none')
+        if repo.get('branch'):
+            options += ['--branch', repo['branch']]
+        return options
+
     def _decrypt_github_token(self, encrypted_token: str) -> str:
         """Decrypt GitHub token - placeholder for decryption logic"""
         # In a real implementation, this would decrypt the token
@@ -177,28 +325,28 @@ class TaskAgent:
             print("No repositories found for this project")
             return
         
-        # Clone each repository
+        # Clone repositories in parallel; git spends its time in the subprocess
         success_count = 0
-        for repo in repositories:
-            if self.clone_repository(repo):
-                success_count += 1
+        with ThreadPoolExecutor(max_workers=self.clone_concurrency) as executor:
+            futures = [executor.submit(self.clone_repository, repo) for repo in repositories]
+            for future in as_completed(futures):
+                if future.result():
+                    success_count += 1
         
         print(f"Workspace setup complete: {success_count}/{len(repositories)} repositories cloned successfully")
         
         # List workspace contents
         print("\nWorkspace contents:")
-        for item in self.workspace_dir.iterdir():
-            if item.is_dir():
-                print(f"  📁 {item.name}/")
-            else:
-                print(f"  📄 {item.name}")
+        with os.scandir(self.workspace_dir) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    print(f"  📁 {entry.name}/")
+                else:
+                    print(f"  📄 {entry.name}")
 
     def get_project_tasks(self) -> List[Dict]:
-        """Fetch pending tasks for the current project"""
-        print(f"Fetching tasks for project {self.project_id}...")
-        
-        endpoint = f"/api/projects/{self.project_id}/tasks"
-        tasks = self.make_api_request(endpoint)
+        """Get pending tasks for the current project"""
+        tasks = self.load_bootstrap().get('tasks')
         
         if tasks is None:
             print("Failed to fetch tasks")
@@ -211,9 +359,9 @@ class TaskAgent:
         return pending_tasks
     
     def get_task_items(self, task_id: str) -> List[Dict]:
-        """Fetch task items for a given task"""
-        endpoint = f"/api/tasks/{task_id}/items"
-        items = self.make_api_request(endpoint)
+        """Get task items for a given task from the bootstrap data"""
+        self.load_bootstrap()
+        items = self._task_items.get(task_id)
         
         if items is None:
             print(f"Failed to fetch task items for task {task_id}")
@@ -241,13 +389,14 @@ class TaskAgent:
                 self.update_task_status(task_id, 'completed')
                 return True
             
-            # Process each task item
+            # Log-only items are handled in order; file creations are collected for execute_file_creations
+            file_items: List[Dict] = []
             for item in task_items:
                 print(f"\nProcessing item: {item['title']}")
                 print(f"Item type: {item['type']}")
                 
                 if item['type'] == 'file_creation':
-                    self.execute_file_creation(item)
+                    file_items.append(item)
                 elif item['type'] == 'planning':
                     print(f"Planning: {item['content']}")
                 elif item['type'] == 'completion':
@@ -255,6 +404,9 @@ class TaskAgent:
                 else:
                     print(f"Unsupported item type: {item['type']}")
             
+            if file_items:
+                self.execute_file_creations(file_items)
+            
             # Mark task as completed
             self.update_task_status(task_id, 'completed')
             print(f"✅ Task completed: {task_title}")
@@ -265,55 +417,95 @@ class TaskAgent:
             self.update_task_status(task_id, 'failed')
             return False
     
-    def execute_file_creation(self, item: Dict):
-        """Execute a file creation task item"""
-        file_path = item.get('filePath')
+    def execute_file_creations(self, items: List[Dict]):
+        """Write all files in parallel, then run the Python files in item order"""
+        # Later items for a path overwrite earlier ones, so only the last write per path matters
+        latest: Dict[str, Dict] = {}
+        for item in items:
+            if item.get('filePath'):
+                latest[item['filePath']] = item
+            else:
+                self.log("No file path specified for file creation")
+        
+        if latest:
+            workers = min(FILE_CREATION_WORKERS, len(latest))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(self.write_file_item, item) for item in latest.values()]
+                for future in as_completed(futures):
+                    # Re-raise worker failures so the task is marked failed
+                    future.result()
+        
+        # Scripts start only once every file exists, since they may import or read each other
+        for item in items:
+            file_path = item.get('filePath')
+            if file_path and file_path.endswith('.py'):
+                self.run_python_file(file_path)
+    
+    def write_file_item(self, item: Dict):
+        """Write a file creation task item into the workspace"""
+        file_path = item['filePath']
         file_content = item.get('fileContent', '')
         
-        if not file_path:
-            print("No file path specified for file creation")
-            return
-        
         # Create the file in the workspace
         full_path = self.workspace_dir / file_path
         
-        # Create parent directories if needed
-        full_path.parent.mkdir(parents=True, exist_ok=True)
+        # Create parent directories once per run
+        if full_path.parent not in self._created_dirs:
+            full_path.parent.mkdir(parents=True, exist_ok=True)
+            self._created_dirs.add(full_path.parent)
         
-        # Write the file
-        with open(full_path, 'w') as f:
-            # Unescape newlines in file content
-            content = file_content.replace('\\n', '\n')
-            f.write(content)
+        # Unescape newlines only when the content actually contains escapes
+        if '\\n' in file_content:
+            file_content = file_content.replace('\\n', '\n')
         
-        print(f"📄 Created file: {full_path}")
+        # Write the file in a single call
+        full_path.write_bytes(file_content.encode('utf-8'))
         
-        # If it's a Python file, try to run it
-        if file_path.endswith('.py'):
-            try:
-                print(f"🐍 Running Python file: {file_path}")
-                result = os.system(f"cd {self.workspace_dir} && python3 {file_path}")
-                if result == 0:
-                    print("✅ Python script executed successfully")
-                else:
-                    print(f"❌ Python script failed with exit code: {result}")
-            except Exception as e:
-                print(f"❌ Failed to run Python script: {e}")
+        self.log(f"📄 Created file: {full_path}")
+    
+    def run_python_file(self, file_path: str):
+        """Run a Python file from the workspace"""
+        full_path = self.workspace_dir / file_path
+        try:
+            self.log(f"🐍 Running Python file: {file_path}")
+            proc = subprocess.run(
+                [sys.executable, str(full_path)],
+                cwd=str(self.workspace_dir),
+                timeout=self.script_timeout,
+                capture_output=True,
+                text=True
+            )
+            output = (proc.stdout or '') + (proc.stderr or '')
+            if proc.returncode == 0:
+                result = "✅ Python script executed successfully"
+            else:
+                result = f"❌ Python script failed with exit code: {proc.returncode}"
+            self.log(f"{output}{result}")
+        except subprocess.TimeoutExpired:
+            self.log(f"❌ Python script timed out after {self.script_timeout}s")
+        except Exception as e:
+            self.log(f"❌ Failed to run Python script: {e}")
     
     def update_task_status(self, task_id: str, status: str):
-        """Update the status of a task"""
-        update_data = {'status': status}
-        
-        if status == 'completed':
-            update_data['completedAt'] = datetime.now().isoformat()
+        """Queue a task status update; 'running' is sent at once, together with the previous task's outcome"""
+        self._status_queue.append({'taskId': task_id, 'status': status})
+        # Tasks run one at a time, so the last task's final status is flushed by the next start or by run()
+        if status == 'running':
+            self.flush_task_statuses()
+    
+    def flush_task_statuses(self):
+        """Send all queued task status updates in a single background request"""
+        if not self._status_queue:
+            return
         
-        endpoint = f"/api/tasks/{task_id}"
-        result = self.make_api_request(endpoint, method='PATCH', data=update_data)
+        # The server stamps completedAt when it applies a completed status
+        updates, self._status_queue = self._status_queue, []
         
-        if result:
-            print(f"Task status updated to: {status}")
-        else:
-            print(f"Failed to update task status to: {status}")
+        self.send_in_background(
+            self._batch_status_url, 'POST', {'updates': updates},
+            f"Task statuses updated: {len(updates)} updates sent",
+            f"Failed to send {len(updates)} task status updates"
+        )
 
     def run(self):
         """Main agent execution loop"""
@@ -340,15 +532,20 @@ class TaskAgent:
                 
                 print(f"\n📊 Execution summary: {executed_count}/{len(tasks)} tasks completed successfully")
             
+            self.flush_task_statuses()
+            
             # Mark container as completed successfully
             self.update_container_status('completed', exit_code=0)
+            self.wait_for_updates()
             print("Container execution completed successfully")
             sys.exit(0)
             
         except Exception as e:
             print(f"Agent execution failed: {e}")
+            self.flush_task_statuses()
             # Mark container as failed
             self.update_container_status('failed', exit_code=1)
+            self.wait_for_updates()
             sys.exit(1)
 
 if __name__ == "__main__":
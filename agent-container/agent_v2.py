@@ -3,135 +3,212 @@
 tandembrain Agent - Task Execution Container with Planner Loop
 """
 
+import atexit
+import logging
+import logging.handlers
 import os
+import queue
+import random
+import sys
 import time
 import json
-import jwt
+import orjson
 import requests
 import subprocess
-from typing import Dict, Any, Optional, List
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Dict, Any, Optional, List, Set, Tuple
+
+from auth import JWT_REFRESH_SKEW, mint_token
+
+log = logging.getLogger('agent')
 
 # Configuration
 BACKEND_URL = os.getenv('BACKEND_URL', 'http://localhost:5000')
-JWT_SECRET = os.getenv('JWT_SECRET', 'your-secret-key')
 PROJECT_ID = os.getenv('PROJECT_ID')
 CONTAINER_ID = os.getenv('CONTAINER_ID')
 WORKSPACE_DIR = '/workspace'
 
+# Project-scoped endpoints are fixed for the container's lifetime
+CLAIM_ENDPOINT = f'/api/projects/{PROJECT_ID}/tasks/claim'
+REPOSITORIES_ENDPOINT = f'/api/projects/{PROJECT_ID}/repositories'
+
+# Task item fields read by build_chat_history; the server omits everything else
+_CHAT_HISTORY_FIELDS = 'createdAt,type,content,chatResponse,toolName,toolParameters,toolResponse'
+# Shallow clones fetch only the tip commit; set AGENT_SHALLOW_CLONE=0 when history is needed
+SHALLOW_CLONE = os.getenv('AGENT_SHALLOW_CLONE', '1') == '1'
+JWT_TTL = 3600  # 1 hour expiration
+TASK_ITEMS_CACHE_TTL = 5  # Seconds
+REPOSITORIES_CACHE_TTL = 600  # Seconds
+GET_CACHE_MAX_ENTRIES = 128
+CLAIM_WAIT = 30  # Seconds the server holds a claim request open waiting for a task
+MIN_CLAIM_INTERVAL = 5  # Seconds between claims when the server answers without waiting
+ERROR_BACKOFF = 60  # Seconds to wait after a loop error; doubles on repeated errors
+MAX_BACKOFF = 300
+
 class TandembrainAgent:
     def __init__(self):
-        self.jwt_token = self.get_jwt_token()
         self.headers = {
-            'Authorization': f'Bearer {self.jwt_token}',
             'Content-Type': 'application/json'
         }
+        
+        # One pooled keep-alive session for all backend traffic
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=10,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        
         self.current_task = None
+        self._error_backoff = ERROR_BACKOFF
         
-    def get_jwt_token(self) -> str:
-        """Generate JWT token for authentication"""
-        payload = {
-            'projectId': PROJECT_ID,
-            'iat': int(time.time()),
-            'exp': int(time.time()) + 3600  # 1 hour expiration
-        }
-        return jwt.encode(payload, JWT_SECRET, algorithm='HS256')
+        # Short-lived memo of idempotent GETs: endpoint -> (expires_at, response)
+        self._get_cache: Dict[str, Tuple[float, Any]] = {}
+        self._get_cache_lock = threading.Lock()
+        
+        # Re-minted by make_api_request near expiry; the session's Authorization header is refreshed in place
+        self._jwt_token = ''
+        self._jwt_exp = 0
+        self._refresh_jwt()
+    
+    def _refresh_jwt(self):
+        """Fetch the current JWT token and install it on the session"""
+        self._jwt_token, self._jwt_exp = mint_token(PROJECT_ID, JWT_TTL)
+        self.headers['Authorization'] = f'Bearer {self._jwt_token}'
+        self.session.headers['Authorization'] = self.headers['Authorization']
     
-    def make_api_request(self, method: str, endpoint: str, data: Optional[Dict] = None) -> Dict[Any, Any]:
+    def make_api_request(self, method: str, endpoint: str, data: Optional[Dict] = None,
+                         timeout: Optional[float] = None) -> Dict[Any, Any]:
         """Make authenticated API request to backend"""
-        url = f"{BACKEND_URL}{endpoint}"
+        url = BACKEND_URL + endpoint
+        
+        # Replace an expiring token before the call
+        if time.time() > self._jwt_exp - JWT_REFRESH_SKEW:
+            self._refresh_jwt()
+        
+        # Content-Type is already set on the session
+        body = orjson.dumps(data) if data is not None else None
         
         try:
-            if method.upper() == 'GET':
-                response = requests.get(url, headers=self.headers)
-            elif method.upper() == 'POST':
-                response = requests.post(url, headers=self.headers, json=data)
-            elif method.upper() == 'PUT':
-                response = requests.put(url, headers=self.headers, json=data)
-            else:
-                raise ValueError(f"Unsupported HTTP method: {method}")
-            
+            response = self.session.request(method.upper(), url, data=body, timeout=timeout)
             response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"API request failed: {e}")
+            return orjson.loads(response.content)
+        except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
+            log.error("API request failed: %s", e)
             return {}
     
+    def _cached_get(self, endpoint: str, ttl: float) -> Any:
+        """GET an endpoint, reusing a response younger than ttl seconds"""
+        now = time.monotonic()
+        with self._get_cache_lock:
+            cached = self._get_cache.get(endpoint)
+            if cached and cached[0] > now:
+                return cached[1]
+        
+        result = self.make_api_request('GET', endpoint)
+        
+        # make_api_request returns {} on failure; don't remember failures
+        if result != {}:
+            with self._get_cache_lock:
+                # Re-inserted so dict order stays oldest-first
+                self._get_cache.pop(endpoint, None)
+                if len(self._get_cache) >= GET_CACHE_MAX_ENTRIES:
+                    self._get_cache = {k: v for k, v in self._get_cache.items() if v[0] > now}
+                    if len(self._get_cache) >= GET_CACHE_MAX_ENTRIES:
+                        # Nothing expired; evict the oldest entry
+                        del self._get_cache[next(iter(self._get_cache))]
+                self._get_cache[endpoint] = (now + ttl, result)
+        return result
+    
+    def _invalidate_cached_get(self, endpoint: str):
+        """Drop a memoized GET response"""
+        with self._get_cache_lock:
+            self._get_cache.pop(endpoint, None)
+    
     def claim_task(self) -> Optional[Dict]:
-        """Claim an available task by setting container ID"""
-        print("Looking for available tasks...")
+        """Claim the next available task, long-polling up to CLAIM_WAIT seconds; the server assigns it atomically"""
+        log.debug("Looking for available tasks...")
         
-        # Get pending tasks for this project
-        tasks = self.make_api_request('GET', f'/api/projects/{PROJECT_ID}/tasks')
+        task = self.make_api_request('POST', f'{CLAIM_ENDPOINT}?wait={CLAIM_WAIT}', {
+            'containerId': CONTAINER_ID
+        }, timeout=CLAIM_WAIT + 5)
         
-        if not tasks:
+        # make_api_request returns {} on failure; let run() back off
+        if task == {}:
+            raise RuntimeError("Failed to claim task")
+        if not task:
             return None
         
-        # Find a pending task without a container
-        for task in tasks:
-            if task.get('status') == 'pending' and not task.get('containerId'):
-                task_id = task['id']
-                
-                # Try to claim the task by setting our container ID
-                update_data = {
-                    'containerId': CONTAINER_ID,
-                    'status': 'running'
-                }
-                
-                result = self.make_api_request('PUT', f'/api/tasks/{task_id}', update_data)
-                
-                if result:
-                    print(f"Successfully claimed task: {task['title']} (ID: {task_id})")
-                    return result
-                else:
-                    print(f"Failed to claim task: {task_id}")
-        
-        return None
+        log.info("Successfully claimed task: %s (ID: %s)", task['title'], task['id'])
+        return task
+    
+    def _task_items_endpoint(self, task_id: str) -> str:
+        """Task items endpoint, ordered oldest first and projected to the chat history fields"""
+        return f'/api/tasks/{task_id}/items?order=asc&fields={_CHAT_HISTORY_FIELDS}'
     
     def get_task_items(self, task_id: str) -> List[Dict]:
         """Get all task items for a task to build chat history"""
-        return self.make_api_request('GET', f'/api/tasks/{task_id}/items') or []
+        return self._cached_get(self._task_items_endpoint(task_id), TASK_ITEMS_CACHE_TTL) or []
     
-    def create_task_item(self, task_id: str, item_data: Dict) -> Optional[Dict]:
-        """Create a new task item"""
-        return self.make_api_request('POST', f'/api/tasks/{task_id}/items', item_data)
+    def create_task_items_bulk(self, task_id: str, items: List[Dict], task_update: Optional[Dict] = None) -> Dict:
+        """Create several task items, in order, and optionally update the task in one request"""
+        payload: Dict[str, Any] = {'items': items}
+        if task_update:
+            payload['task'] = task_update
+        
+        result = self.make_api_request('POST', f'/api/tasks/{task_id}/items/batch', payload)
+        if result:
+            self._invalidate_cached_get(self._task_items_endpoint(task_id))
+        return result
     
     def build_chat_history(self, task_items: List[Dict]) -> List[Dict]:
         """Build chat history from task items"""
-        chat_history = []
-        
-        # Sort task items by creation time
-        sorted_items = sorted(task_items, key=lambda x: x.get('createdAt', ''))
+        # Each item yields at most three messages; fill a preallocated list and trim it
+        chat_history: List[Any] = [None] * (3 * len(task_items))
+        count = 0
         
-        for item in sorted_items:
-            item_type = item.get('type')
-            content = item.get('content', '')
-            chat_response = item.get('chatResponse', '')
+        # get_task_items returns items already ordered by creation time
+        for item in task_items:
+            get = item.get
+            item_type = get('type')
+            content = get('content', '')
+            chat_response = get('chatResponse', '')
+            tool_name = get('toolName')
             
             if item_type == 'planning' and content:
-                chat_history.append({
+                chat_history[count] = {
                     'role': 'user',
                     'content': content
-                })
+                }
+                count += 1
             
             if chat_response:
-                chat_history.append({
+                chat_history[count] = {
                     'role': 'assistant', 
                     'content': chat_response
-                })
+                }
+                count += 1
             
             # Add tool calls to history
-            if item.get('toolName'):
-                tool_call = {
+            if tool_name:
+                chat_history[count] = {
                     'role': 'assistant',
-                    'content': f"I'll use the {item['toolName']} tool.",
+                    'content': f"I'll use the {tool_name} tool.",
                     'tool_calls': [{
-                        'name': item['toolName'],
-                        'parameters': item.get('toolParameters', {}),
-                        'response': item.get('toolResponse', {})
+                        'name': tool_name,
+                        'parameters': get('toolParameters', {}),
+                        'response': get('toolResponse', {})
                     }]
                 }
-                chat_history.append(tool_call)
+                count += 1
         
+        del chat_history[count:]
         return chat_history
     
     def execute_planner_loop(self, task: Dict):
@@ -140,14 +217,17 @@ class TandembrainAgent:
         task_title = task['title']
         task_description = task.get('description', '')
         
-        print(f"Starting planner execution for task: {task_title}")
+        log.info("Starting planner execution for task: %s", task_title)
         
         # Get existing task items to build chat history
         task_items = self.get_task_items(task_id)
         chat_history = self.build_chat_history(task_items)
         
-        print(f"Found {len(task_items)} existing task items")
-        print(f"Built chat history with {len(chat_history)} messages")
+        log.info("Found %d existing task items", len(task_items))
+        log.info("Built chat history with %d messages", len(chat_history))
+        
+        # New items are sent together with the completion update in a single request
+        new_items = []
         
         # If no existing items, create initial planning item
         if not task_items:
@@ -159,13 +239,11 @@ class TandembrainAgent:
                 'content': initial_content
             }
             
-            created_item = self.create_task_item(task_id, planning_item)
-            if created_item:
-                print("Created initial planning task item")
-                chat_history.append({
-                    'role': 'user',
-                    'content': initial_content
-                })
+            new_items.append(planning_item)
+            chat_history.append({
+                'role': 'user',
+                'content': initial_content
+            })
         
         # Simulate planner response (in real implementation, this would call an LLM)
         if chat_history:
@@ -179,18 +257,20 @@ class TandembrainAgent:
                 'chatResponse': planner_response
             }
             
-            created_response = self.create_task_item(task_id, response_item)
-            if created_response:
-                print("Created planner response task item")
+            new_items.append(response_item)
         
         # Mark task as completed for now (in real implementation, this would be more complex)
+        # The server stamps completedAt when it applies the completed status
         completion_data = {
-            'status': 'completed',
-            'completedAt': time.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+            'status': 'completed'
         }
         
-        self.make_api_request('PUT', f'/api/tasks/{task_id}', completion_data)
-        print(f"Task {task_title} marked as completed")
+        result = self.create_task_items_bulk(task_id, new_items, completion_data)
+        if result:
+            log.info("Created %d task items", len(result.get('items', [])))
+            log.info("Task %s marked as completed", task_title)
+        else:
+            log.error("Failed to record planner results for task %s", task_title)
     
     def generate_planner_response(self, chat_history: List[Dict], task: Dict) -> str:
         """Generate planner response (placeholder for LLM integration)"""
@@ -216,63 +296,92 @@ This is a placeholder response. In the full implementation, this would:
 
 The task has been processed and is ready for more sophisticated planning integration."""
     
-    def clone_repositories(self):
-        """Clone project repositories into workspace"""
-        print("Fetching project repositories...")
+    def clone_repositories(self) -> List[str]:
+        """Clone project repositories into workspace in parallel; returns error messages"""
+        log.info("Fetching project repositories...")
         
-        repos = self.make_api_request('GET', f'/api/projects/{PROJECT_ID}/repositories')
+        repos = self._cached_get(REPOSITORIES_ENDPOINT, REPOSITORIES_CACHE_TTL)
         
         if not repos:
-            print("No repositories found for this project")
-            return
+            log.info("No repositories found for this project")
+            return []
         
         os.makedirs(WORKSPACE_DIR, exist_ok=True)
         
-        for repo in repos:
-            repo_name = repo.get('name', 'unknown')
-            repo_url = repo.get('url', '')
-            github_token = repo.get('githubToken')
-            is_private = repo.get('isPrivate', False)
-            
-            if not repo_url:
-                print(f"Skipping repository {repo_name}: No URL provided")
-                continue
-            
-            print(f"Cloning repository: {repo_name}")
-            
-            # Prepare clone URL with authentication for private repos
-            clone_url = repo_url
-            if is_private and github_token:
-                # Insert token into GitHub URL
-                if 'github.com' in repo_url:
-                    clone_url = repo_url.replace('https://github.com/', f'https://{github_token}@github.com/')
-            
-            repo_path = os.path.join(WORKSPACE_DIR, repo_name)
-            
-            try:
-                if os.path.exists(repo_path):
-                    print(f"Repository {repo_name} already exists, pulling latest changes...")
-                    subprocess.run(['git', 'pull'], cwd=repo_path, check=True)
+        # One directory scan instead of an exists() check per repository
+        with os.scandir(WORKSPACE_DIR) as entries:
+            existing = {entry.name for entry in entries}
+        
+        # Each clone is an independent network-bound subprocess
+        with ThreadPoolExecutor(max_workers=min(8, len(repos))) as executor:
+            results = executor.map(lambda repo: self._clone_one_repo(repo, existing), repos)
+            errors = [error for error in results if error]
+        
+        for error in errors:
+            log.warning(error)
+        return errors
+    
+    def _clone_one_repo(self, repo: Dict, existing: Set[str]) -> Optional[str]:
+        """Clone or update a single repository; returns an error message on failure"""
+        repo_name = repo.get('name', 'unknown')
+        repo_url = repo.get('url', '')
+        github_token = repo.get('githubToken')
+        is_private = repo.get('isPrivate', False)
+        
+        if not repo_url:
+            return f"Skipping repository {repo_name}: No URL provided"
+        
+        log.info("Cloning repository: %s", repo_name)
+        
+        # Prepare clone URL with authentication for private repos
+        clone_url = repo_url
+        if is_private and github_token:
+            # Insert token into GitHub URL
+            if 'github.com' in repo_url:
+                clone_url = repo_url.replace('https://github.com/', f'https://{github_token}@github.com/')
+        
+        repo_path = os.path.join(WORKSPACE_DIR, repo_name)
+        
+        try:
+            if repo_name in existing:
+                log.info("Repository %s already exists, pulling latest changes...", repo_name)
+                if SHALLOW_CLONE:
+                    self._run_git(['-C', repo_path, 'fetch', '--depth=1', 'origin', 'HEAD'])
+                    self._run_git(['-C', repo_path, 'reset', '--hard', 'FETCH_HEAD'])
                 else:
-                    subprocess.run(['git', 'clone', clone_url, repo_path], check=True)
-                    print(f"Successfully cloned {repo_name}")
-            except subprocess.CalledProcessError as e:
-                print(f"Failed to clone {repo_name}: {e}")
+                    self._run_git(['-C', repo_path, 'pull'])
+            else:
+                if SHALLOW_CLONE:
+                    self._run_git(['clone', '--depth=1', '--single-branch', clone_url, repo_path])
+                else:
+                    # Full history, but blobs are only downloaded when checked out
+                    self._run_git(['clone', '--filter=blob:none', clone_url, repo_path])
+                log.info("Successfully cloned %s", repo_name)
+        except subprocess.CalledProcessError as e:
+            # Report git's stderr; the command line may contain the token
+            return f"Failed to clone {repo_name}: {(e.stderr or '').strip()}"
+        return None
+    
+    def _run_git(self, args: List[str]):
+        """Run git quietly, keeping stderr for error reporting"""
+        subprocess.run(['git', *args], check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
     
     def run(self):
         """Main agent execution loop"""
-        print(f"Neural Notify Agent starting for project {PROJECT_ID}")
-        print(f"Container ID: {CONTAINER_ID}")
+        log.info("Neural Notify Agent starting for project %s", PROJECT_ID)
+        log.info("Container ID: %s", CONTAINER_ID)
         
         # Clone repositories first
         self.clone_repositories()
         
-        print("Starting task execution loop...")
+        log.info("Starting task execution loop...")
         
         # Main task execution loop
         while True:
             try:
                 # Try to claim a task
+                claim_started = time.monotonic()
                 task = self.claim_task()
                 
                 if task:
@@ -280,11 +389,16 @@ The task has been processed and is ready for more sophisticated planning integra
                     self.execute_planner_loop(task)
                     self.current_task = None
                 else:
-                    print("No available tasks, waiting...")
-                    time.sleep(30)  # Wait 30 seconds before checking again
+                    # The claim normally waited server-side; only pause if it returned early
+                    log.debug("No available tasks, polling again...")
+                    elapsed = time.monotonic() - claim_started
+                    if elapsed < MIN_CLAIM_INTERVAL:
+                        time.sleep(MIN_CLAIM_INTERVAL - elapsed)
+                
+                self._error_backoff = ERROR_BACKOFF
                     
             except Exception as e:
-                print(f"Error in task execution loop: {e}")
+                log.error("Error in task execution loop: %s", e)
                 if self.current_task:
                     # Mark current task as failed
                     self.make_api_request('PUT', f'/api/tasks/{self.current_task["id"]}', {
@@ -292,8 +406,28 @@ The task has been processed and is ready for more sophisticated planning integra
                     })
                     self.current_task = None
                 
-                time.sleep(60)  # Wait before retrying
+                self._error_backoff = self._sleep_with_backoff(self._error_backoff)  # Wait before retrying
+    
+    def _sleep_with_backoff(self, delay: float) -> float:
+        """Sleep for delay plus up to 30% jitter; returns the next, doubled delay"""
+        # Jitter keeps a fleet of containers from polling the backend in lock-step
+        time.sleep(delay + random.uniform(0, delay * 0.3))
+        return min(delay * 2, MAX_BACKOFF)
+
+def setup_logging():
+    """Log through a queue so stdout writes happen on a background thread"""
+    log_queue: queue.Queue = queue.Queue()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    root = logging.getLogger()
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener.start()
+    # Flush whatever is still queued on exit
+    atexit.register(listener.stop)
 
 if __name__ == "__main__":
+    setup_logging()
     agent = TandembrainAgent()
     agent.run()
\ No newline at end of file
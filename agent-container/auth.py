@@ -0,0 +1,23 @@
+"""
+Agent JWT minting for the planner agent
+"""
+
+import os
+import time
+import jwt
+from typing import Tuple
+
+JWT_SECRET = os.getenv('JWT_SECRET', 'your-secret-key')
+JWT_KEY = JWT_SECRET.encode()  # Encoded once; PyJWT accepts the HMAC key as bytes
+JWT_REFRESH_SKEW = 60  # Callers re-mint this many seconds before expiry
+
+def mint_token(project_id: str, ttl: int = 3600) -> Tuple[str, int]:
+    """Sign a token for a project; returns (token, expires_at) so callers can reuse it until near expiry"""
+    now = int(time.time())
+    exp = now + ttl
+    payload = {
+        'projectId': project_id,
+        'iat': now,
+        'exp': exp
+    }
+    return jwt.encode(payload, JWT_KEY, algorithm='HS256'), exp
@@ -7,6 +7,9 @@ import os
 import requests
 import json
 
+# Shared so both checks reuse one keep-alive connection
+session = requests.Session()
+
 def test_token_generation():
     """Test JWT token generation"""
     api_url = "http://localhost:5000"
@@ -16,7 +19,7 @@ def test_token_generation():
     
     try:
         # Generate token
-        response = requests.post(
+        response = session.post(
             f"{api_url}/api/projects/{project_id}/agent-token",
             json={"taskId": "test-task"}
         )
@@ -46,7 +49,7 @@ def test_agent_api(token):
     print("\nTesting agent repositories endpoint...")
     
     try:
-        response = requests.get(f"{api_url}/api/agent/repositories", headers=headers)
+        response = session.get(f"{api_url}/api/agent/repositories", headers=headers)
         
         if response.status_code == 200:
             repos = response.json()
@@ -1,12 +1,36 @@
-import type { Express } from "express";
+import type { Express, Response } from "express";
 import { createServer, type Server } from "http";
+import { EventEmitter } from "events";
 import { storage } from "./storage";
-import { insertProjectSchema, insertTaskSchema, insertGithubRepositorySchema, insertGlobalRepositorySchema, insertTaskItemSchema, insertContainerSchema } from "@shared/schema";
+import { insertProjectSchema, insertTaskSchema, insertGithubRepositorySchema, insertGlobalRepositorySchema, insertTaskItemSchema, insertContainerSchema, taskStatusEnum, type GithubRepository } from "@shared/schema";
 import { generateAgentToken, verifyAgentToken, extractTokenFromRequest } from "./auth";
 import { requireAuth, AuthRequest } from "./middleware/auth";
 import { z } from "zod";
 
+// Long-polling task claims wait at most this long
+const MAX_CLAIM_WAIT_SECONDS = 30;
+
 export async function registerRoutes(app: Express): Promise<Server> {
+  // Emits a project id whenever one of its tasks becomes pending, waking long-polling agents
+  const pendingTasks = new EventEmitter();
+  pendingTasks.setMaxListeners(0);
+
+  // Resolves when the project gets a pending task, the timeout passes, or the client goes away
+  const waitForPendingTask = (projectId: string, timeoutMs: number, res: Response) => new Promise<void>(resolve => {
+    const onPending = (pendingProjectId: string) => {
+      if (pendingProjectId === projectId) done();
+    };
+    const timer = setTimeout(done, timeoutMs);
+    function done() {
+      clearTimeout(timer);
+      pendingTasks.off("pending", onPending);
+      res.off("close", done);
+      resolve();
+    }
+    pendingTasks.on("pending", onPending);
+    res.once("close", done);
+  });
+
   // Dashboard stats (requires auth)
   app.get("/api/dashboard/stats", requireAuth, async (req: AuthRequest, res) => {
     try {
@@ -182,6 +206,42 @@ export async function registerRoutes(app: Express): Promise<Server> {
     }
   });
 
+  // Atomically assign the oldest unclaimed pending task to a container; responds with null when none is available.
+  // With ?wait=N the request is held up to N seconds until a task can be claimed.
+  app.post("/api/projects/:projectId/tasks/claim", async (req, res) => {
+    try {
+      const { containerId } = z.object({ containerId: z.string() }).parse(req.body);
+      const { projectId } = req.params;
+      const waitSeconds = Math.min(Math.max(Number(req.query.wait) || 0, 0), MAX_CLAIM_WAIT_SECONDS);
+      const deadline = Date.now() + waitSeconds * 1000;
+
+      let disconnected = false;
+      res.on("close", () => { disconnected = true; });
+
+      let task = await storage.claimNextTask(projectId, containerId);
+      while (!task && !disconnected && Date.now() < deadline) {
+        // Woken by new pending tasks; otherwise the database is checked once more at the deadline
+        await waitForPendingTask(projectId, deadline - Date.now(), res);
+        if (disconnected) break;
+        task = await storage.claimNextTask(projectId, containerId);
+      }
+
+      if (task && disconnected) {
+        // The client left while the claim UPDATE was running; hand the task back
+        await storage.updateTask(task.id, { status: "pending", containerId: null });
+        pendingTasks.emit("pending", projectId);
+        return;
+      }
+
+      res.json(task ?? null);
+    } catch (error) {
+      if (error instanceof z.ZodError) {
+        return res.status(400).json({ message: "Invalid claim request", errors: error.errors });
+      }
+      res.status(500).json({ message: "Failed to claim task" });
+    }
+  });
+
   app.get("/api/tasks/:id", async (req, res) => {
     try {
       const task = await storage.getTask(req.params.id);
@@ -258,25 +318,65 @@ export async function registerRoutes(app: Express): Promise<Server> {
     next();
   };
 
+  // Decrypt GitHub tokens for agent use
+  const withDecryptedTokens = async (repositories: GithubRepository[]) => {
+    const { decryptToken } = await import('./crypto');
+    return repositories.map(repo => ({
+      ...repo,
+      githubToken: repo.githubToken ? decryptToken(repo.githubToken) : null
+    }));
+  };
+
   // Agent-specific repository endpoint
   app.get("/api/agent/repositories", authenticateAgent, async (req: any, res) => {
     try {
       const { project_id } = req.agent;
       const repositories = await storage.getRepositoriesByProject(project_id);
-      
-      // Decrypt GitHub tokens for agent use
-      const { decryptToken } = await import('./crypto');
-      const reposWithDecryptedTokens = repositories.map(repo => ({
-        ...repo,
-        githubToken: repo.githubToken ? decryptToken(repo.githubToken) : null
-      }));
-      
-      res.json(reposWithDecryptedTokens);
+      res.json(await withDecryptedTokens(repositories));
     } catch (error) {
       res.status(500).json({ message: "Failed to fetch repositories" });
     }
   });
 
+  // Everything the agent needs to start in one round trip: repositories plus pending tasks with their items
+  app.get("/api/agent/bootstrap", authenticateAgent, async (req: any, res) => {
+    try {
+      const { project_id } = req.agent;
+      const [repositories, tasks] = await Promise.all([
+        storage.getRepositoriesByProject(project_id),
+        storage.getPendingTasksWithItems(project_id),
+      ]);
+
+      res.json({ repositories: await withDecryptedTokens(repositories), tasks });
+    } catch (error) {
+      res.status(500).json({ message: "Failed to fetch agent bootstrap data" });
+    }
+  });
+
+  // Apply several task status updates from an agent in one request
+  const batchStatusSchema = z.object({
+    updates: z.array(z.object({
+      taskId: z.string(),
+      status: z.enum(taskStatusEnum.enumValues),
+    })),
+  });
+
+  app.post("/api/agent/tasks/batch-status", authenticateAgent, async (req: any, res) => {
+    try {
+      const { updates } = batchStatusSchema.parse(req.body);
+      const tasks = await storage.updateProjectTaskStatuses(req.agent.project_id, updates);
+      if (!tasks) {
+        return res.status(404).json({ message: "Task not found" });
+      }
+      res.json(tasks);
+    } catch (error) {
+      if (error instanceof z.ZodError) {
+        return res.status(400).json({ message: "Invalid status updates", errors: error.errors });
+      }
+      res.status(500).json({ message: "Failed to update task statuses" });
+    }
+  });
+
   // Repository updates (linking to projects)
   app.put("/api/repositories/:id", async (req, res) => {
     try {
@@ -330,6 +430,9 @@ export async function registerRoutes(app: Express): Promise<Server> {
         projectId: req.params.projectId,
       });
       const task = await storage.createTask(taskData);
+      if (task.status === "pending") {
+        pendingTasks.emit("pending", task.projectId);
+      }
       
       // Check if we should auto-create a container
       const project = await storage.getProjectById(req.params.projectId);
@@ -400,6 +503,9 @@ export async function registerRoutes(app: Express): Promise<Server> {
     try {
       const taskData = insertTaskSchema.partial().parse(req.body);
       const task = await storage.updateTask(req.params.id, taskData);
+      if (task?.status === "pending") {
+        pendingTasks.emit("pending", task.projectId);
+      }
       res.json(task);
     } catch (error) {
       if (error instanceof z.ZodError) {
@@ -421,7 +527,18 @@ export async function registerRoutes(app: Express): Promise<Server> {
   // Task Items
   app.get("/api/tasks/:taskId/items", async (req, res) => {
     try {
-      const taskItems = await storage.getTaskItems(req.params.taskId);
+      // Items are ordered by createdAt; ?order=asc returns oldest first
+      const order = req.query.order === "asc" ? "asc" : "desc";
+      const taskItems = await storage.getTaskItems(req.params.taskId, order);
+
+      // ?fields=a,b limits each item to the listed keys
+      if (typeof req.query.fields === "string") {
+        const fields = req.query.fields.split(",");
+        return res.json(taskItems.map(item =>
+          Object.fromEntries(fields.filter(field => Object.hasOwn(item, field)).map(field => [field, item[field as keyof typeof item]]))
+        ));
+      }
+
       res.json(taskItems);
     } catch (error) {
       console.error("Error fetching task items:", error);
@@ -429,6 +546,25 @@ export async function registerRoutes(app: Express): Promise<Server> {
     }
   });
 
+  // Create several items for a task in order, optionally updating the task in the same request
+  const taskItemsBatchSchema = z.object({
+    items: z.array(insertTaskItemSchema.omit({ taskId: true })),
+    task: insertTaskSchema.partial().optional(),
+  });
+
+  app.post("/api/tasks/:taskId/items/batch", async (req, res) => {
+    try {
+      const { items, task: taskUpdate } = taskItemsBatchSchema.parse(req.body);
+      const result = await storage.createTaskItemsBatch(req.params.taskId, items, taskUpdate);
+      res.status(201).json(result);
+    } catch (error) {
+      if (error instanceof z.ZodError) {
+        return res.status(400).json({ message: "Invalid task item batch", errors: error.errors });
+      }
+      res.status(500).json({ message: "Failed to create task items" });
+    }
+  });
+
   app.get("/api/task-items/:id", async (req, res) => {
     try {
       const taskItem = await storage.getTaskItem(req.params.id);
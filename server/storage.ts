@@ -27,7 +27,7 @@ import {
   type InsertUser
 } from "@shared/schema";
 import { db } from "./db";
-import { eq, desc, and, or, isNull, sql, inArray } from "drizzle-orm";
+import { eq, asc, desc, and, or, isNull, sql, inArray } from "drizzle-orm";
 
 export interface IStorage {
   // Users
@@ -60,15 +60,19 @@ export interface IStorage {
   getTask(id: string): Promise<TaskWithProject | undefined>;
   getTaskWithChildren(id: string): Promise<TaskWithChildren | undefined>;
   getTaskWithItems(id: string): Promise<TaskWithItems | undefined>;
+  getPendingTasksWithItems(projectId: string): Promise<TaskWithItems[]>;
   getParentTasks(projectId?: string): Promise<TaskWithProjectAndChildren[]>;
   createTask(task: InsertTask): Promise<Task>;
   updateTask(id: string, task: Partial<InsertTask>): Promise<Task>;
+  updateProjectTaskStatuses(projectId: string, updates: { taskId: string; status: Task["status"] }[]): Promise<Task[] | undefined>;
+  claimNextTask(projectId: string, containerId: string): Promise<Task | undefined>;
   deleteTask(id: string): Promise<void>;
 
   // Task Items
-  getTaskItems(taskId: string): Promise<TaskItemWithChildren[]>;
+  getTaskItems(taskId: string, order?: "asc" | "desc"): Promise<TaskItemWithChildren[]>;
   getTaskItem(id: string): Promise<TaskItem | undefined>;
   createTaskItem(taskItem: InsertTaskItem): Promise<TaskItem>;
+  createTaskItemsBatch(taskId: string, items: Omit<InsertTaskItem, "taskId">[], taskUpdate?: Partial<InsertTask>): Promise<{ items: TaskItem[]; task?: Task }>;
   updateTaskItem(id: string, taskItem: Partial<InsertTaskItem>): Promise<TaskItem>;
   deleteTaskItem(id: string): Promise<void>;
 
@@ -302,6 +306,61 @@ export class DatabaseStorage implements IStorage {
     return task;
   }
 
+  async updateProjectTaskStatuses(projectId: string, updates: { taskId: string; status: Task["status"] }[]): Promise<Task[] | undefined> {
+    // Refuse the whole batch if any task belongs to another project
+    const taskIds = Array.from(new Set(updates.map(update => update.taskId)));
+    if (taskIds.length > 0) {
+      const owned = await db
+        .select({ id: tasks.id })
+        .from(tasks)
+        .where(and(eq(tasks.projectId, projectId), inArray(tasks.id, taskIds)));
+      if (owned.length !== taskIds.length) {
+        return undefined;
+      }
+    }
+
+    const updated: Task[] = [];
+    // Applied in order so a task's later status wins
+    for (const { taskId, status } of updates) {
+      const [task] = await db
+        .update(tasks)
+        .set({
+          status,
+          updatedAt: new Date(),
+          ...(status === "completed" && { completedAt: new Date() }),
+        })
+        .where(and(eq(tasks.id, taskId), eq(tasks.projectId, projectId)))
+        .returning();
+      updated.push(task);
+    }
+    return updated;
+  }
+
+  async claimNextTask(projectId: string, containerId: string): Promise<Task | undefined> {
+    // Single statement so concurrent agents never claim the same task; SKIP LOCKED lets them pass each other
+    const [task] = await db
+      .update(tasks)
+      .set({
+        status: "running",
+        containerId,
+        updatedAt: new Date(),
+      })
+      .where(and(
+        eq(tasks.status, "pending"),
+        eq(tasks.id, sql`(
+          select ${tasks.id} from ${tasks}
+          where ${tasks.projectId} = ${projectId}
+            and ${tasks.status} = 'pending'
+            and ${tasks.containerId} is null
+          order by ${tasks.createdAt}
+          limit 1
+          for update skip locked
+        )`)
+      ))
+      .returning();
+    return task;
+  }
+
   async deleteTask(id: string): Promise<void> {
     await db.delete(tasks).where(eq(tasks.id, id));
   }
@@ -331,6 +390,24 @@ export class DatabaseStorage implements IStorage {
     });
   }
 
+  async getPendingTasksWithItems(projectId: string): Promise<TaskWithItems[]> {
+    return await db.query.tasks.findMany({
+      where: and(eq(tasks.projectId, projectId), eq(tasks.status, "pending")),
+      with: {
+        taskItems: {
+          where: isNull(taskItems.parentId),
+          with: {
+            children: {
+              orderBy: [desc(taskItems.createdAt)],
+            },
+          },
+          orderBy: [desc(taskItems.createdAt)],
+        },
+      },
+      orderBy: [desc(tasks.createdAt)],
+    });
+  }
+
   async getParentTasks(projectId?: string): Promise<TaskWithProjectAndChildren[]> {
     const whereClause = projectId 
       ? and(isNull(tasks.parentId), eq(tasks.projectId, projectId))
@@ -348,7 +425,7 @@ export class DatabaseStorage implements IStorage {
     });
   }
 
-  async getTaskItems(taskId: string): Promise<TaskItemWithChildren[]> {
+  async getTaskItems(taskId: string, order: "asc" | "desc" = "desc"): Promise<TaskItemWithChildren[]> {
     return await db.query.taskItems.findMany({
       where: and(eq(taskItems.taskId, taskId), isNull(taskItems.parentId)),
       with: {
@@ -356,7 +433,7 @@ export class DatabaseStorage implements IStorage {
           orderBy: [desc(taskItems.createdAt)],
         },
       },
-      orderBy: [desc(taskItems.createdAt)],
+      orderBy: [order === "asc" ? asc(taskItems.createdAt) : desc(taskItems.createdAt)],
     });
   }
 
@@ -380,6 +457,46 @@ export class DatabaseStorage implements IStorage {
     return taskItem;
   }
 
+  async createTaskItemsBatch(
+    taskId: string,
+    items: Omit<InsertTaskItem, "taskId">[],
+    taskUpdate?: Partial<InsertTask>,
+  ): Promise<{ items: TaskItem[]; task?: Task }> {
+    // All items and the task update are applied together or not at all
+    return db.transaction(async (tx) => {
+      const createdItems: TaskItem[] = [];
+      // Sequential with clock_timestamp() so createdAt follows the order the items were sent in;
+      // the column default now() would give every row the transaction's start time
+      for (const item of items) {
+        const [taskItem] = await tx
+          .insert(taskItems)
+          .values({
+            ...item,
+            taskId,
+            createdAt: sql`clock_timestamp()`,
+            updatedAt: new Date(),
+          })
+          .returning();
+        createdItems.push(taskItem);
+      }
+
+      let task: Task | undefined;
+      if (taskUpdate) {
+        [task] = await tx
+          .update(tasks)
+          .set({
+            ...taskUpdate,
+            updatedAt: new Date(),
+            ...(taskUpdate.status === "completed" && { completedAt: new Date() }),
+          })
+          .where(eq(tasks.id, taskId))
+          .returning();
+      }
+
+      return { items: createdItems, task };
+    });
+  }
+
   async updateTaskItem(id: string, insertTaskItem: Partial<InsertTaskItem>): Promise<TaskItem> {
     const [taskItem] = await db
       .update(taskItems)